@@ -1,10 +1,12 @@
-import os, sys, subprocess
+import os, re, sys, subprocess
 import ip_analysis
 
 VERSION = 1.0
 RECENT_SRC_PATH_FILE = 'recent_source_path.txt'
 HTML_FILE_NAME = 'index.html'
 FEEDBACK_FILE_NAME = 'GRADING_FEEDBACK.txt'
+CODE_DIR_NAMES = ['scripts', 'styles']
+CODE_FILE_EXTENSIONS = ('.js', '.css')
 
 # Check for dependencies
 # Python deps
@@ -38,6 +40,30 @@ def validte_source_path(path_str):
         return True
     return "Not a valid directory path. Please specify an exisiting FOLDER, not a file."
 
+def is_paper_root(path_str:str)->bool:
+    """
+    Check whether the given directory has the Interactive Paper folder structure
+    ('docs', 'scripts', 'styles' folders, HTML_FILE_NAME and '.gitignore' files)
+    """
+    ip_dirs = ['docs', 'scripts', 'styles']
+    ip_files = [HTML_FILE_NAME, '.gitignore']
+    try:
+        sub_fs = list(os.scandir(path_str))
+    except OSError:
+        return False
+    for sub_f in sub_fs:
+        if sub_f.is_dir():
+            try:
+                ip_dirs.remove(sub_f.name)
+            except ValueError:
+                continue
+        elif sub_f.is_file():
+            try:
+                ip_files.remove(sub_f.name)
+            except ValueError:
+                continue
+    return not ip_dirs and not ip_files
+
 def get_default_source_path():
     default_path = ''
     # Look for a 'recent_source_path' file
@@ -56,20 +82,7 @@ def get_default_source_path():
     if not default_path:
         for f in os.scandir("."):
             if f.is_dir() and f.name[0] not in '._' and 'env' not in f.name:
-                ip_dirs = ['docs', 'scripts', 'styles']
-                ip_files = [HTML_FILE_NAME, '.gitignore']
-                for sub_f in os.scandir(f.path):
-                    if sub_f.is_dir():
-                        try:
-                            ip_dirs.remove(sub_f.name)
-                        except ValueError:
-                            continue
-                    elif sub_f.is_file():
-                        try:
-                            ip_files.remove(sub_f.name)
-                        except ValueError:
-                            continue
-                if not ip_dirs and not ip_files:
+                if is_paper_root(f.path):
                     # Interactive Paper folder found
                     default_path = os.path.join(f.path, 'docs')
 
@@ -131,12 +144,23 @@ def prompt_choose_dirs(path_str):
         raise KeyboardInterrupt
     return chosen_dirs
 
-def check_syntax(filename:str):
+def check_syntax_files(filepaths:list[str])->tuple[dict, str]:
     """
-    Check that the given file is formatted correctly and whether it contains any syntax errors.
+    Check that the given files are formatted correctly and whether they contain any syntax errors,
+    using a single prettier invocation for all of them.
 
-    filepath
-        Path to a code file supported by prettier.
+    filepaths
+        Paths to code files supported by prettier.
+
+    (Return)
+        check_syntax_results:dict
+            (key) filepath (value) dict
+                passed:bool
+                    False when prettier found a syntax error in the file, True otherwise.
+                output:str
+                    Prettier output related to the file
+        other_output:str
+            Prettier errors that could not be attributed to any of the given files
     """
     # Requires prettier to be installed in system
     # Prettier exit codes:
@@ -144,25 +168,132 @@ def check_syntax(filename:str):
     #   1: Something wasn't formatted properly
     #   2: Something's wrong with Prettier
 
-    check_syntax_result = {
-        'passed': True,
-        'output': ''
-    }
+    check_syntax_results = dict() # Return value
+    other_output = '' # Return value
+    if not filepaths:
+        return check_syntax_results, other_output
+
+    # Run prettier from the common directory, so that the file paths in its output
+    # can be matched against the (relative) paths passed to it
+    cwd = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in filepaths])
+    relpaths = []
+    path_names = dict() # (key) any name prettier may print for a file (value) filepath
+    for filepath in filepaths:
+        abspath = os.path.abspath(filepath)
+        relpath = os.path.relpath(abspath, cwd)
+        relpaths.append(relpath)
+        for path_name in (relpath, abspath, relpath.replace(os.sep, '/'), abspath.replace(os.sep, '/')):
+            path_names[path_name] = filepath
+        check_syntax_results[filepath] = {
+            'passed': True,
+            'output': ''
+        }
+    # Errors name their file either at the start ('<path>: SyntaxError ...') or quoted
+    # ('No parser could be inferred for file "<path>".'). Longest paths first, so that
+    # the most specific path wins.
+    path_alternatives = '|'.join(re.escape(path_name) for path_name in sorted(path_names, key=len, reverse=True))
+    error_start_pattern = re.compile(f'^\\s*({path_alternatives}): ')
+    quoted_path_pattern = re.compile(f'"({path_alternatives})"')
+    # Code frame lines following an error, e.g. '  1 | code', '> 2 | code', '    |   ^'
+    code_frame_pattern = re.compile(r'^\s*(>\s*)?(\d+\s*)?\|')
 
     try:
-        prc = subprocess.run(["prettier", "-c", filename], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True, encoding='utf-8')
+        subprocess.run(["prettier", "-c", *relpaths], cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True, encoding='utf-8')
     except subprocess.CalledProcessError as err:
         if err.returncode == 2:
-            check_syntax_result['passed'] = False
             prettier_output = err.output
             prettier_output = prettier_output.split("\n")
             prettier_output = [output for output in prettier_output \
                 if ('Checking formatting...' not in output and 'All matched files use Prettier code style!' not in output)]
-            prettier_output = "\n".join(prettier_output)
-            check_syntax_result['output'] = prettier_output
-    
+
+            # Attribute each error to the file it names. Code frame lines belong
+            # to the file named by the error line above them.
+            file_outputs = dict()
+            unattributed_output = []
+            current_file = None
+            for output in prettier_output:
+                if not output.startswith('[error]'):
+                    current_file = None
+                    continue
+                error_text = output[len('[error]'):]
+                # Code frame lines may quote other files (e.g. '<script src="...">'),
+                # so only lines opening a new error are searched for a file name
+                if not (current_file and code_frame_pattern.match(error_text)):
+                    path_match = error_start_pattern.match(error_text) or quoted_path_pattern.search(error_text)
+                    current_file = path_names[path_match.group(1)] if path_match else None
+                if current_file:
+                    file_outputs.setdefault(current_file, []).append(output)
+                else:
+                    unattributed_output.append(output)
+
+            for filepath, outputs in file_outputs.items():
+                check_syntax_results[filepath]['passed'] = False
+                check_syntax_results[filepath]['output'] = "\n".join(outputs)
+            other_output = "\n".join(unattributed_output)
+
+    return check_syntax_results, other_output
+
+def check_syntax(filename:str):
+    """
+    Check that the given file is formatted correctly and whether it contains any syntax errors.
+
+    filepath
+        Path to a code file supported by prettier.
+    """
+    check_syntax_results, other_output = check_syntax_files([filename])
+    check_syntax_result = check_syntax_results[filename]
+    # With a single file, any prettier error concerns that file
+    if other_output:
+        check_syntax_result['passed'] = False
+        check_syntax_result['output'] = "\n".join(filter(None, [check_syntax_result['output'], other_output]))
     return check_syntax_result
 
+def find_paper_root(dirpath:str):
+    """
+    Find the Interactive Paper root folder of the given directory, if any.
+    Only the directory itself and its parent (e.g. when grading '<root>/docs') are checked.
+    """
+    path_str = os.path.abspath(dirpath)
+    for candidate_path in (path_str, os.path.dirname(path_str)):
+        if is_paper_root(candidate_path):
+            return candidate_path
+    return None
+
+def find_code_files(dirpath:str)->list[str]:
+    """
+    Find JS and CSS files of a submission: those in the given directory and in the
+    CODE_DIR_NAMES folders of both the given directory and its Interactive Paper root
+    """
+    code_file_paths = []
+    for f in sorted(os.scandir(dirpath), key=lambda f: f.name):
+        if f.is_file() and f.name.endswith(CODE_FILE_EXTENSIONS):
+            code_file_paths.append(f.path)
+
+    code_dir_parents = [dirpath]
+    paper_root = find_paper_root(dirpath)
+    if paper_root and paper_root != os.path.abspath(dirpath):
+        code_dir_parents.append(paper_root)
+    for code_dir_parent in code_dir_parents:
+        for code_dir_name in CODE_DIR_NAMES:
+            for root, dirs, files in os.walk(os.path.join(code_dir_parent, code_dir_name)):
+                dirs[:] = sorted(d for d in dirs if d[0] != '.' and d != 'node_modules')
+                for filename in sorted(files):
+                    if filename.endswith(CODE_FILE_EXTENSIONS):
+                        code_file_paths.append(os.path.join(root, filename))
+    return code_file_paths
+
+def get_syntax_feedback_string(check_syntax_result:dict)->str:
+    syntax_feedback_string = '' # Return value
+    syntax_feedback_string += "1. Syntax Check Results\n\n"
+    if not check_syntax_result['passed']:
+        if check_syntax_result['output']:
+            syntax_feedback_string += "Syntax error(s) found. The details of the first(if many) syntax error found is shown below.\n\n"
+            syntax_feedback_string += check_syntax_result['output']
+            syntax_feedback_string += "\n\n"
+    else:
+        syntax_feedback_string += "No syntax error found. Well done!\n\n\n"
+    return syntax_feedback_string
+
 def grade_directory(dirpath):
     grading_results = [] # Return value
     
@@ -172,6 +303,16 @@ def grade_directory(dirpath):
         if '.html' in f.name:
             html_file_paths.append(f)
 
+    # Parse footnotes of every HTML file once, indexing footnote IDs across files
+    footnote_index = ip_analysis.FootnoteIndex()
+    for html_file in html_file_paths:
+        footnote_index.update(html_file.path)
+
+    # Check syntax of every HTML, JS and CSS file with a single prettier run
+    code_file_paths = find_code_files(dirpath)
+    check_syntax_results, other_syntax_output = \
+        check_syntax_files([html_file.path for html_file in html_file_paths] + code_file_paths)
+
     first_file_in_directory = True
 
     for html_file in html_file_paths:
@@ -192,7 +333,7 @@ def grade_directory(dirpath):
             return grading_result
         
         # Check syntax
-        check_syntax_result = check_syntax(html_file_path)
+        check_syntax_result = check_syntax_results[html_file_path]
         grading_result['check_syntax_passed'] = check_syntax_result['passed']
         if first_file_in_directory:
             file_open_mode = 'w'
@@ -202,17 +343,11 @@ def grade_directory(dirpath):
 
         with open(os.path.join(dirpath, FEEDBACK_FILE_NAME), file_open_mode) as f:
             f.write(f'<{html_file.name}>\n\n')
-            f.write("1. Syntax Check Results\n\n")
-            if not check_syntax_result['passed']:
-                if check_syntax_result['output']:     
-                    f.write("Syntax error(s) found. The details of the first(if many) syntax error found is shown below.\n\n")
-                    f.write(check_syntax_result['output'])
-                    f.write("\n\n")
-            else:
-                f.write("No syntax error found. Well done!\n\n\n")
+            f.write(get_syntax_feedback_string(check_syntax_result))
         
         # Check footnotes
-        analysis_result, analysis_string = ip_analysis.run_analysis(html_file_path)
+        analysis_result, analysis_string = \
+            ip_analysis.run_analysis(html_file_path, footnote_index.get_page(html_file_path))
         grading_result['check_footnotes_passed'] = analysis_result['passed']
         # If no footnote was found in HTML, issue a warning
         if not analysis_result['correct_count'] and not analysis_result['problematic_count']:
@@ -224,6 +359,66 @@ def grade_directory(dirpath):
         
         grading_results.append(grading_result)
 
+    # Scripts and styles are only syntax checked
+    for code_file_path in code_file_paths:
+        code_file_name = os.path.relpath(code_file_path, dirpath)
+        grading_result = {
+            'filename': code_file_name,
+            'error': False,
+            'message': '',
+            'check_syntax_passed': False,
+        }
+
+        check_syntax_result = check_syntax_results[code_file_path]
+        grading_result['check_syntax_passed'] = check_syntax_result['passed']
+        if first_file_in_directory:
+            file_open_mode = 'w'
+            first_file_in_directory = False
+        else:
+            file_open_mode = 'a'
+
+        with open(os.path.join(dirpath, FEEDBACK_FILE_NAME), file_open_mode) as f:
+            f.write(f'<{code_file_name}>\n\n')
+            f.write(get_syntax_feedback_string(check_syntax_result))
+
+        grading_results.append(grading_result)
+
+    # Prettier errors not related to any single file
+    if other_syntax_output:
+        grading_result = {
+            'filename': 'prettier',
+            'error': True,
+            'message': f"Prettier reported errors not related to a single file. See '{FEEDBACK_FILE_NAME}' for details.",
+        }
+        if first_file_in_directory:
+            file_open_mode = 'w'
+            first_file_in_directory = False
+        else:
+            file_open_mode = 'a'
+
+        with open(os.path.join(dirpath, FEEDBACK_FILE_NAME), file_open_mode) as f:
+            f.write('<Other syntax check errors>\n\n')
+            f.write(other_syntax_output)
+            f.write("\n\n")
+
+        grading_results.append(grading_result)
+
+    # Check footnotes shared across files, if the paper is split over multiple files
+    if len(html_file_paths) > 1:
+        grading_result = {
+            'filename': f'{len(html_file_paths)} HTML files combined',
+            'error': False,
+            'message': '',
+            'check_footnotes_passed': False,
+        }
+        analysis_result, analysis_string = ip_analysis.run_cross_file_analysis(footnote_index)
+        grading_result['check_footnotes_passed'] = analysis_result['passed']
+        if not analysis_result['passed'] and analysis_string:
+            with open(os.path.join(dirpath, FEEDBACK_FILE_NAME), "a") as f:
+                f.write('<Cross-file footnote analysis>\n\n')
+                f.write(analysis_string)
+        grading_results.append(grading_result)
+
     return grading_results
 
 def check_result(result:bool)->str:
@@ -256,8 +451,11 @@ def main():
                 if grading_result['error']:
                     print(f"\tError: {grading_result['message']}")
                 else:
-                    print(f'\tSyntax check   : {check_result(grading_result["check_syntax_passed"])}')
-                    print(f'\tFootnotes check: {check_result(grading_result["check_footnotes_passed"])}')
+                    # Scripts and styles have no footnotes, combined HTML files have no syntax check
+                    if 'check_syntax_passed' in grading_result:
+                        print(f'\tSyntax check   : {check_result(grading_result["check_syntax_passed"])}')
+                    if 'check_footnotes_passed' in grading_result:
+                        print(f'\tFootnotes check: {check_result(grading_result["check_footnotes_passed"])}')
                     if grading_result['message']:
                         print(grading_result['message'])
                 print()
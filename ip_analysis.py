@@ -1,6 +1,6 @@
 # ip_analysis = Interactive Paper Analysis Module
 
-import sys
+import os, sys
 from bs4 import BeautifulSoup
 
 ORPHANED_FOOTNOTE_DESCRIPTION = """   Orphaned footnotes are footnotes without a matching footnote link(a tags).
@@ -9,6 +9,10 @@ BROKEN_FOOTNOTE_DESCRIPTION = """   Broken footnotes are footnote links without
    In other words, nothing will be displayed when a broken footnote link is clicked."""
 DUPLICATE_FOOTNOTE_DESCRIPTION = """   Footnotes with duplicates mean that there are multiple footnote contents with the same ID.
    Footnote IDs must be unique across an entire Interactive Paper document."""
+CROSS_FILE_FOOTNOTE_DESCRIPTION = """   The footnotes below have the same ID in more than one HTML file of this Interactive Paper.
+   They are checked as a whole document, with links and contents from every file combined."""
+CROSS_PAGE_FOOTNOTE_DESCRIPTION = """   Cross-page footnotes are footnotes whose links and contents are in different HTML files.
+   A footnote link can only display content on its own page, so every file with a link needs the content."""
 EMPTY_ID_FOOTNOTE_DESCRIPTION = """   All footnote links must either have a non-empty inner text or a non-empty 'data-ip-footnote-id' attribute.
    All footnote content divs must have a non-empty id attribute."""
 
@@ -19,6 +23,9 @@ class Footnote:
         self._footnote_id = footnote_id
         self._links = []
         self._contents = []
+        # Source file of each link/content, only filled when merged across files
+        self._link_files = []
+        self._content_files = []
     
     @property
     def links(self):
@@ -68,6 +75,28 @@ class Footnote:
         
         return f_id
     
+    def merge(self, other, filename:str):
+        """
+        Add the links and contents of another footnote with the same ID,
+        recording the file they were found in
+
+        other
+            Footnote parsed from a single HTML file
+        filename
+            Name of the file 'other' was parsed from
+        """
+        for link_elem in other.links:
+            self.links = link_elem
+            self._link_files.append(filename)
+        for content_elem in other.contents:
+            self.contents = content_elem
+            self._content_files.append(filename)
+    
+    def get_location_text(self, elem, filename=None)->str:
+        if filename:
+            return f"{filename}, Line {'{:5d}'.format(elem.sourceline)}"
+        return f"Line {'{:5d}'.format(elem.sourceline)}"
+    
     def get_link_text(self, link_elem=None)->str:
         # Get the tag as string
         link_text = str(link_elem)
@@ -126,14 +155,18 @@ class Footnote:
         duplicates = len(self._contents) > 1
         # If ID is empty
         empty_id = self._footnote_id == '__EMPTY_ID__'
+        # Links and contents in different files (only known when merged across files)
+        cross_page = bool(self._link_files) and bool(self._content_files) \
+            and set(self._link_files) != set(self._content_files)
 
-        problematic = orphaned or broken or duplicates or empty_id
+        problematic = orphaned or broken or duplicates or empty_id or cross_page
 
         return dict(problematic=problematic, 
                         orphaned=orphaned,
                         broken=broken,
                         duplicates=duplicates,
-                        empty_id=empty_id)
+                        empty_id=empty_id,
+                        cross_page=cross_page)
     
     def __str__(self):
         """
@@ -153,6 +186,10 @@ class Footnote:
                     if problems_str:
                         problems_str += ', '
                     problems_str += 'BROKEN'
+                if problems['cross_page']:
+                    if problems_str:
+                        problems_str += ', '
+                    problems_str += 'CROSS-PAGE'
                 if problems['duplicates']:
                     if problems_str:
                         problems_str += ', '
@@ -176,9 +213,10 @@ class Footnote:
         if problems['orphaned'] and not problems['empty_id']:
             footnote_str += "\tNo link found (orphaned).\n"
         else:
-            for link_elem in self._links:
+            for idx, link_elem in enumerate(self._links):
                 link_text = self.get_link_text(link_elem)
-                footnote_str += f"\tLine {'{:5d}'.format(link_elem.sourceline)}  |  {link_text}\n"
+                filename = self._link_files[idx] if idx < len(self._link_files) else None
+                footnote_str += f"\t{self.get_location_text(link_elem, filename)}  |  {link_text}\n"
         footnote_str += '\n'
         
         # Content(s)
@@ -187,9 +225,10 @@ class Footnote:
         if problems['broken'] and not problems['empty_id']:
             footnote_str += "\tNo content found (broken).\n"
         else:
-            for content_elem in self._contents:
+            for idx, content_elem in enumerate(self._contents):
                 content_text = self.get_content_text(content_elem)
-                footnote_str += f"\tLine {'{:5d}'.format(content_elem.sourceline)}  |  {content_text}\n"
+                filename = self._content_files[idx] if idx < len(self._content_files) else None
+                footnote_str += f"\t{self.get_location_text(content_elem, filename)}  |  {content_text}\n"
         
         # Seperator
         footnote_str += "-"*79
@@ -255,6 +294,83 @@ def parse_file(filepath:str):
     
     return found_footnotes
 
+class FootnoteIndex:
+    """
+    Index of footnote IDs across all HTML files of a single Interactive Paper.
+
+    Each file is parsed once. The index maps every footnote ID to the files it
+    appears in, so that footnotes sharing an ID across files can be merged and
+    checked as a whole document. Updating a single file only marks the IDs found
+    in that file, which are merged again the next time they are requested.
+    """
+    def __init__(self):
+        # (key) filepath (value) dict of Footnote objects parsed from that file
+        self._pages = dict()
+        # (key) footnote ID (value) set of filepaths containing that ID
+        self._id_files = dict()
+        # (key) footnote ID (value) Footnote merged across files
+        self._merged = dict()
+        # IDs changed since the merged footnotes were last built
+        self._dirty_ids = set()
+
+    def get_page(self, filepath:str)->dict:
+        """
+        Footnotes parsed from a single file, as returned by parse_file
+        """
+        return self._pages.get(filepath, dict())
+
+    def update(self, filepath:str):
+        """
+        Parse (or re-parse) the given file and update the index
+
+        filepath
+            Path to an HTML file containing Interactive Paper code.
+        """
+        self.remove(filepath)
+        found_footnotes = parse_file(filepath)
+        self._pages[filepath] = found_footnotes
+        for footnote_id in found_footnotes:
+            self._id_files.setdefault(footnote_id, set()).add(filepath)
+            self._dirty_ids.add(footnote_id)
+
+    def remove(self, filepath:str):
+        """
+        Remove every footnote found in the given file from the index
+        """
+        found_footnotes = self._pages.pop(filepath, None)
+        if found_footnotes is None:
+            return
+        for footnote_id in found_footnotes:
+            self._id_files[footnote_id].discard(filepath)
+            if not self._id_files[footnote_id]:
+                del self._id_files[footnote_id]
+            self._dirty_ids.add(footnote_id)
+
+    def _merge(self, footnote_id:str):
+        """
+        Rebuild the merged footnote of a single ID from the files containing it
+        """
+        # Sorted, so that the order of links and contents does not depend on update order
+        filepaths = sorted(self._id_files.get(footnote_id, ()))
+        # IDs found in a single file are checked by the per-file analysis
+        if len(filepaths) < 2 or footnote_id == '__EMPTY_ID__':
+            self._merged.pop(footnote_id, None)
+            return
+        merged_footnote = Footnote(footnote_id)
+        for filepath in filepaths:
+            merged_footnote.merge(self._pages[filepath][footnote_id], os.path.basename(filepath))
+        self._merged[footnote_id] = merged_footnote
+
+    def get_cross_file_footnotes(self)->dict:
+        """
+        Footnotes whose ID appears in more than one file, with the links and
+        contents of every file merged into a single Footnote object
+        """
+        for footnote_id in self._dirty_ids:
+            self._merge(footnote_id)
+        self._dirty_ids.clear()
+        return self._merged
+
 def check_footnotes(footnotes:list[Footnote])->tuple[int, int, dict]:
     """
     Check if parsed footnotes have problems, and categorize them into appropriate lists
@@ -268,6 +384,7 @@ def check_footnotes(footnotes:list[Footnote])->tuple[int, int, dict]:
             (key) 'orphaned' (value) list[Footnotes]
             (key) 'broken' (value) list[Footnotes]
             (key) 'duplicates' (value) list[Footntoes]
+            (key) 'cross_page' (value) list[Footnotes]
     """
     # Init
     correct_count = 0
@@ -276,7 +393,8 @@ def check_footnotes(footnotes:list[Footnote])->tuple[int, int, dict]:
         'orphaned': [],
         'broken': [],
         'duplicates': [],
-        'empty_id': []
+        'empty_id': [],
+        'cross_page': []
     }
     
     # For every footnote
@@ -294,6 +412,7 @@ def check_footnotes(footnotes:list[Footnote])->tuple[int, int, dict]:
         is_broken = problems['broken']
         duplicates_exist = problems['duplicates']
         empty_id = problems['empty_id']
+        is_cross_page = problems['cross_page']
 
         if empty_id:
             problematic_footnotes['empty_id'].append(footnote_obj)
@@ -303,6 +422,8 @@ def check_footnotes(footnotes:list[Footnote])->tuple[int, int, dict]:
             problematic_footnotes['broken'].append(footnote_obj)
         elif duplicates_exist:
             problematic_footnotes['duplicates'].append(footnote_obj)
+        elif is_cross_page:
+            problematic_footnotes['cross_page'].append(footnote_obj)
     
     return correct_count, problematic_count, problematic_footnotes
 
@@ -313,6 +434,7 @@ def get_problems_string(problematic_footnotes):
     broken = problematic_footnotes['broken']
     duplicates = problematic_footnotes['duplicates']
     empty_id = problematic_footnotes['empty_id']
+    cross_page = problematic_footnotes['cross_page']
 
     # Orphaned footnotes
     if orphaned:
@@ -330,6 +452,14 @@ def get_problems_string(problematic_footnotes):
             problems_str += str(footnote_obj) + "\n\n"
         problems_str += '\n'
     
+    # Footnotes with links and contents in different files
+    if cross_page:
+        problems_str += f">> Found {len(cross_page)} cross-page footnote{'s' if len(cross_page) > 1 else ''}.\n"
+        problems_str += CROSS_PAGE_FOOTNOTE_DESCRIPTION + "\n\n"
+        for footnote_obj in cross_page:
+            problems_str += str(footnote_obj) + "\n\n"
+        problems_str += '\n'
+    
     # Footnotes with duplicates
     if duplicates:
         problems_str += f">> Found {len(duplicates)} footnote{'s' if len(duplicates) > 1 else ''} with duplicates.\n"
@@ -361,12 +491,15 @@ def get_analysis_string(correct_count, problematic_count, problematic_footnotes)
     analysis_string += get_problems_string(problematic_footnotes)
     return analysis_string
 
-def run_analysis(filepath:str)->tuple[dict, str]:
+def run_analysis(filepath:str, found_footnotes:dict=None)->tuple[dict, str]:
     """
     Run check on the given Interactive Paper HTML code.
 
     filepath
         Path to an HTML file containing Interactive Paper code.
+    found_footnotes
+        (Optional) Footnotes already parsed from filepath, e.g. by a FootnoteIndex.
+        The file is parsed again when not given.
 
     (Return)
         analysis_result:dict
@@ -379,7 +512,8 @@ def run_analysis(filepath:str)->tuple[dict, str]:
         analysis_string:str
             String containing explanation of check result
     """
-    found_footnotes = parse_file(filepath)
+    if found_footnotes is None:
+        found_footnotes = parse_file(filepath)
     correct_count, problematic_count, problematic_footnotes = \
         check_footnotes(found_footnotes)
     analysis_string = \
@@ -393,6 +527,44 @@ def run_analysis(filepath:str)->tuple[dict, str]:
     
     return analysis_result, analysis_string
 
+def run_cross_file_analysis(footnote_index:FootnoteIndex)->tuple[dict, str]:
+    """
+    Run check on footnotes whose ID is shared by multiple HTML files of the same
+    Interactive Paper, treating all files as a single document.
+
+    footnote_index
+        FootnoteIndex containing every HTML file of the Interactive Paper.
+
+    (Return)
+        analysis_result:dict
+            passed:bool
+                True when no footnote shared across files is problematic, False otherwise.
+            correct_count:int
+                Number of correctly formatted footnotes shared across files
+            problematic_count:int
+                Number of incorrectly formatted footnotes shared across files
+        analysis_string:str
+            String containing explanation of check result
+    """
+    cross_file_footnotes = footnote_index.get_cross_file_footnotes()
+    correct_count, problematic_count, problematic_footnotes = \
+        check_footnotes(cross_file_footnotes)
+
+    analysis_string = ''
+    if problematic_count:
+        analysis_string += f"Found {problematic_count} footnote{'s' if problematic_count > 1 else ''} "
+        analysis_string += "shared across files with problems (details listed below).\n"
+        analysis_string += CROSS_FILE_FOOTNOTE_DESCRIPTION + "\n\n"
+        analysis_string += get_problems_string(problematic_footnotes)
+
+    analysis_result = {
+        'passed': problematic_count == 0,
+        'correct_count' : correct_count,
+        'problematic_count': problematic_count
+    }
+
+    return analysis_result, analysis_string
+
 def main():
     """
     Runner code when the module is run directly